@@ -0,0 +1,211 @@
+import os
+import shutil
+import subprocess
+import sys
+
+from click.testing import CliRunner
+
+from uncompyle6.bin.uncompile import (
+    _expand_dirs,
+    _init_worker,
+    _split_src_base,
+    main_bin,
+)
+
+bytecode_dir = os.path.join(os.path.dirname(__file__), "..", "test", "bytecode_3.8")
+
+
+def _path(top, name):
+    return os.path.join(top, *name.split("/"))
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "w").close()
+
+
+def test_expand_dirs(tmp_path):
+    top = str(tmp_path)
+    for name in ("a.pyc", "b.pyo", "c.py", "sub/d.pyc", "sub/deeper/e.pyc"):
+        _touch(_path(top, name))
+    plain = os.path.join(top, "c.py")
+    missing = os.path.join(top, "missing.pyc")
+
+    # Directories are expanded recursively; files and missing paths
+    # are passed through as given.
+    got = list(_expand_dirs([top, plain, missing]))
+    assert sorted(got[:-2]) == [
+        _path(top, name)
+        for name in ("a.pyc", "b.pyo", "sub/d.pyc", "sub/deeper/e.pyc")
+    ]
+    assert got[-2:] == [plain, missing]
+
+
+def _scandir_failing_on(failing_path, error):
+    real_scandir = os.scandir
+
+    def scandir(path):
+        if path == failing_path:
+            raise error(path)
+        return real_scandir(path)
+
+    return scandir
+
+
+def test_expand_dirs_unreadable_subdir(tmp_path, monkeypatch):
+    top = str(tmp_path)
+    for name in ("a.pyc", "sub/b.pyc", "other/c.pyc"):
+        _touch(_path(top, name))
+
+    # As with os.walk(), subdirectories that can't be read, or that
+    # vanish during the walk, are skipped; the rest is still found and
+    # the directory argument is not treated as a file.
+    for error in (PermissionError, FileNotFoundError):
+        monkeypatch.setattr(
+            os, "scandir", _scandir_failing_on(os.path.join(top, "sub"), error)
+        )
+        assert sorted(_expand_dirs([top])) == [
+            os.path.join(top, "a.pyc"),
+            _path(top, "other/c.pyc"),
+        ]
+
+
+def test_split_src_base():
+    j = os.path.join
+    assert _split_src_base([]) == ("", [])
+    assert _split_src_base(["x.pyc"]) == ("", ["x.pyc"])
+    assert _split_src_base([j("bla", "x.pyc")]) == ("bla", ["x.pyc"])
+
+    # Only whole path components are common.
+    assert _split_src_base(
+        [j("some", "classes", "a.pyc"), j("some", "cmds", "b.pyc")]
+    ) == ("some", [j("classes", "a.pyc"), j("cmds", "b.pyc")])
+    assert _split_src_base([j("bla", "fasel.pyc"), j("bar", "foo.pyc")]) == (
+        "",
+        [j("bla", "fasel.pyc"), j("bar", "foo.pyc")],
+    )
+
+    # The same file twice still gives its directory.
+    assert _split_src_base([j("bla", "x.pyc"), j("bla", "x.pyc")]) == (
+        "bla",
+        ["x.pyc", "x.pyc"],
+    )
+    assert _split_src_base(["x.pyc", "x.pyc"]) == ("", ["x.pyc", "x.pyc"])
+
+    # Paths are normalized before stripping.
+    assert _split_src_base([j(".", "a", "x.pyc"), j(".", "a", "sub", "y.pyc")]) == (
+        "a",
+        ["x.pyc", j("sub", "y.pyc")],
+    )
+    assert _split_src_base([j(".", "x.pyc")]) == ("", ["x.pyc"])
+
+    # Nothing in common between absolute and relative paths.
+    abs_path = os.path.abspath(j("a", "x.pyc"))
+    assert _split_src_base([abs_path, j("a", "y.pyc")]) == (
+        "",
+        [abs_path, j("a", "y.pyc")],
+    )
+    assert _split_src_base([abs_path]) == (os.path.dirname(abs_path), ["x.pyc"])
+
+
+def _read_tree(top):
+    tree = {}
+    for root, _, files in os.walk(top):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path) as f:
+                tree[os.path.relpath(path, top)] = f.read()
+    return tree
+
+
+def test_processes(tmp_path):
+    src = tmp_path / "src"
+    for i, name in enumerate(sorted(os.listdir(bytecode_dir))[:8]):
+        dest = src / "sub" if i % 2 else src
+        dest.mkdir(parents=True, exist_ok=True)
+        shutil.copy(os.path.join(bytecode_dir, name), str(dest))
+
+    # Decompiling with a pool of workers gives the same files as doing
+    # it in this process.
+    trees = []
+    for numproc in ("1", "3"):
+        out = tmp_path / ("out" + numproc)
+        out.mkdir()
+        result = CliRunner().invoke(
+            main_bin, ["-p", numproc, "-r", "-o", str(out), str(src)]
+        )
+        assert result.exit_code == 0, result.output
+        assert "decompiled 8 files: 8 okay, 0 failed" in result.output
+        trees.append(_read_tree(str(out)))
+    assert len(trees[0]) == 8
+    assert trees[0] == trees[1]
+
+
+def test_processes_failing_input(tmp_path):
+    good = os.path.join(bytecode_dir, "01_for_continue.pyc")
+    bad = tmp_path / "bad.pyc"
+    bad.write_bytes(b"garbage")
+
+    # A pyc file that can't be loaded is reported the same way as
+    # without -p, rather than as a traceback from a worker.
+    result = CliRunner().invoke(main_bin, ["-p", "2", str(bad), good])
+    assert result.exit_code == 2
+    assert "too short to be a valid pyc file" in result.output
+    assert "Traceback" not in result.output
+
+    # Errors writing the output aren't swallowed either.
+    not_a_dir = tmp_path / "afile"
+    not_a_dir.write_text("")
+    result = CliRunner().invoke(
+        main_bin, ["-p", "2", "-o", str(not_a_dir), good, good]
+    )
+    assert isinstance(result.exception, NotADirectoryError)
+    assert "decompiled" not in result.output
+
+
+def test_processes_to_stdout():
+    import uncompyle6
+
+    names = sorted(n for n in os.listdir(bytecode_dir) if n.endswith(".pyc"))
+    # Enough files that, with -o, each worker would get several at once.
+    paths = [os.path.join(bytecode_dir, name) for name in names] * 3
+    count = len(paths)
+
+    # Without -o, every file's source goes to stdout, however many
+    # files each worker is handed. The workers' output only reaches
+    # the real stdout, so run the command in a subprocess.
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.dirname(os.path.dirname(uncompyle6.__file__))
+    result = subprocess.run(
+        [sys.executable, "-m", "uncompyle6.bin.uncompile", "-p", "2"] + paths,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+    )
+    output = result.stdout.decode()
+    assert result.returncode == 0, result.stderr.decode()
+    assert f"decompiled {count} files: {count} okay, 0 failed" in output
+    assert output.count("# okay decompiling") == count
+
+
+def _child_sigint_handler(_):
+    return subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import signal; print(signal.getsignal(signal.SIGINT))",
+        ],
+        stdout=subprocess.PIPE,
+    ).stdout.decode()
+
+
+def test_worker_children_get_sigint():
+    from multiprocessing import Array, Pool
+
+    # Workers leave ^C to the parent, but programs they run, such as
+    # --verify=run scripts, must still be interruptible.
+    with Pool(
+        1, initializer=_init_worker, initargs=("", None, None, {}, Array("q", 4))
+    ) as pool:
+        handler = pool.apply(_child_sigint_handler, (None,))
+    assert "default_int_handler" in handler
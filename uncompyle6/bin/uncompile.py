@@ -7,10 +7,12 @@
 #
 from __future__ import print_function
 
+import io
 import os
+import signal
 import sys
 import time
-from typing import List
+from typing import Iterator, List, Tuple
 
 import click
 from xdis.version_info import version_tuple_to_str
@@ -21,12 +23,125 @@ from uncompyle6.version import __version__
 
 program = "uncompyle6"
 
+# File name suffixes looked for when recursing directories.
+PYC_SUFFIXES = (".pyc", ".pyo")
+
+# Arguments to main() that are the same for every file a worker
+# process decompiles, along with the shared counters the worker adds
+# its results to. These are set once per worker by _init_worker()
+# so that only the bytecode paths are sent over for each task.
+_worker_args = None
+
 
 def usage():
     print(__doc__)
     sys.exit(1)
 
 
+def _iter_pyc(dir_entries) -> Iterator[str]:
+    """
+    Yield the paths of all .pyc and .pyo files in the os.scandir()
+    iterator ``dir_entries`` and, recursively, in its subdirectories.
+    """
+    with dir_entries:
+        for entry in dir_entries:
+            if entry.is_dir(follow_symlinks=False):
+                try:
+                    sub_entries = os.scandir(entry.path)
+                except OSError:
+                    # Like os.walk(), skip directories we can't read.
+                    continue
+                yield from _iter_pyc(sub_entries)
+            elif entry.name.endswith(PYC_SUFFIXES):
+                yield entry.path
+
+
+def _expand_dirs(paths: List[str]) -> Iterator[str]:
+    """
+    Yield ``paths`` with each directory replaced by the .pyc and .pyo
+    files found under it.
+
+    Rather than stat()ing each path first to see whether it is a
+    directory, just try to scan it; anything else is passed through
+    for main() to decompile or report.
+    """
+    for path in paths:
+        try:
+            dir_entries = os.scandir(path)
+        except (NotADirectoryError, FileNotFoundError):
+            yield path
+        except OSError:
+            continue
+        else:
+            yield from _iter_pyc(dir_entries)
+
+
+def _split_src_base(paths: List[str]) -> Tuple[str, List[str]]:
+    """
+    Return the directory common to all of ``paths``, along with
+    ``paths`` made relative to that directory.
+    """
+    # commonpath() compares whole path components, so files in
+    # 'some/classes' and 'some/cmds' give 'some', not 'some/c'. It
+    # normalizes what it returns, so the paths must be normalized too.
+    # That gives us our own copy of the list, which is stripped in place.
+    paths = [os.path.normpath(f) for f in paths]
+    if not paths:
+        return "", paths
+    try:
+        src_base = os.path.commonpath(paths)
+    except ValueError:
+        # A mix of absolute and relative paths, or different drives.
+        return "", paths
+    if src_base in paths:
+        # A single file, or the same file given more than once:
+        # the common path is that file, not a directory.
+        src_base = os.path.dirname(src_base)
+    if src_base:
+        sb_len = len(os.path.join(src_base, ""))
+        for i, f in enumerate(paths):
+            paths[i] = f[sb_len:]
+    return src_base, paths
+
+
+def _init_worker(src_base: str, out_base, outfile, options: dict, counts):
+    global _worker_args
+    _worker_args = (src_base, out_base, outfile, options, counts)
+    # Leave ^C to the parent, which shuts the whole pool down. Otherwise
+    # every worker would get its own KeyboardInterrupt and carry on with
+    # the batches still queued. Use a do-nothing handler rather than
+    # SIG_IGN: an ignored signal stays ignored across exec, so programs
+    # run by --verify=run would not stop on ^C either.
+    signal.signal(signal.SIGINT, lambda signum, frame: None)
+    # Block-buffer stdout instead of line-buffering it, so workers
+    # write in larger pieces rather than one line at a time. main()
+    # still flushes after each file it writes to an output directory,
+    # a full buffer flushes on its own, and _decompile_batch() flushes
+    # at the end of each batch.
+    if hasattr(sys.stdout, "buffer"):
+        sys.stdout = io.TextIOWrapper(
+            sys.stdout.buffer,
+            encoding=sys.stdout.encoding,
+            errors=sys.stdout.errors,
+            line_buffering=False,
+        )
+
+
+def _decompile_batch(paths: List[str]):
+    """
+    Decompile ``paths`` in a single call to main() and add the
+    (total, okay, failed, verify-failed) file counts it returns to the
+    shared ``counts`` array.
+    """
+    src_base, out_base, outfile, options, counts = _worker_args
+    try:
+        result = main(src_base, out_base, paths, [], outfile, **options)
+    finally:
+        sys.stdout.flush()
+    with counts.get_lock():
+        counts[:] = [total + n for total, n in zip(counts[:], result)]
+
+
 # __doc__ = """
 # Usage:
 #   %s [OPTIONS]... [ FILE | DIR]...
@@ -115,6 +230,14 @@ def usage():
     "recurse_dirs",
     default=False,
 )
+@click.option(
+    "--processes",
+    "-p",
+    "numproc",
+    type=click.IntRange(min=1),
+    default=1,
+    help="number of processes to decompile with; default is 1.",
+)
 @click.option(
     "--output",
     "-o",
@@ -131,7 +254,6 @@ def usage():
     default=0,
     help="start decomplation at offset; default is 0 or the starting offset.",
 )
-@click.version_option(version=__version__)
 @click.option(
     "--stop-offset",
     "stop_offset",
@@ -149,6 +271,7 @@ def main_bin(
     linemaps: bool,
     verify,
     recurse_dirs: bool,
+    numproc: int,
     outfile,
     start_offset: int,
     stop_offset: int,
@@ -167,35 +290,17 @@ def main_bin(
         )
         sys.exit(-1)
 
-    numproc = 0
-    out_base = None
-
     out_base = None
     source_paths: List[str] = []
     timestamp = False
     timestampfmt = "# %Y.%m.%d %H:%M:%S %Z"
-    pyc_paths = files
+    pyc_paths = list(files)
 
     # Expand directory if "recurse" was specified.
     if recurse_dirs:
-        expanded_files = []
-        for f in pyc_paths:
-            if os.path.isdir(f):
-                for root, _, dir_files in os.walk(f):
-                    for df in dir_files:
-                        if df.endswith(".pyc") or df.endswith(".pyo"):
-                            expanded_files.append(os.path.join(root, df))
-        pyc_paths = expanded_files
-
-    # argl, commonprefix works on strings, not on path parts,
-    # thus we must handle the case with files in 'some/classes'
-    # and 'some/cmds'
-    src_base = os.path.commonprefix(pyc_paths)
-    if src_base[-1:] != os.sep:
-        src_base = os.path.dirname(src_base)
-    if src_base:
-        sb_len = len(os.path.join(src_base, ""))
-        pyc_paths = [f[sb_len:] for f in pyc_paths]
+        pyc_paths = list(_expand_dirs(pyc_paths))
+
+    src_base, pyc_paths = _split_src_base(pyc_paths)
 
     if not pyc_paths and not source_paths:
         print("No input files given to decompile", file=sys.stderr)
@@ -219,8 +324,18 @@ def main_bin(
     if timestamp:
         print(time.strftime(timestampfmt))
 
+    show_ast = {"before": tree or tree_plus, "after": tree_plus}
+    options = {
+        "showasm": asm_opt,
+        "showgrammar": show_grammar,
+        "showast": show_ast,
+        "do_verify": verify,
+        "do_linemaps": linemaps,
+        "start_offset": start_offset,
+        "stop_offset": stop_offset,
+    }
+
     if numproc <= 1:
-        show_ast = {"before": tree or tree_plus, "after": tree_plus}
         try:
             result = main(
                 src_base,
@@ -228,17 +343,11 @@ def main_bin(
                 pyc_paths,
                 source_paths,
                 outfile,
-                showasm=asm_opt,
-                showgrammar=show_grammar,
-                showast=show_ast,
-                do_verify=verify,
-                do_linemaps=linemaps,
-                start_offset=start_offset,
-                stop_offset=stop_offset,
+                **options,
             )
             if len(pyc_paths) > 1:
                 mess = status_msg(*result)
-                print("# " + mess)
+                sys.stdout.write(f"# {mess}\n")
                 pass
         except ImportError as e:
             print(str(e))
@@ -248,72 +357,49 @@ def main_bin(
         except VerifyCmpError:
             raise
     else:
-        from multiprocessing import Process, Queue
-
-        try:
-            from Queue import Empty
-        except ImportError:
-            from queue import Empty
-
-        fqueue = Queue(len(pyc_paths) + numproc)
-        for f in pyc_paths:
-            fqueue.put(f)
-        for i in range(numproc):
-            fqueue.put(None)
-
-        rqueue = Queue(numproc)
-
-        tot_files = okay_files = failed_files = verify_failed_files = 0
-
-        def process_func():
-            (tot_files, okay_files, failed_files, verify_failed_files) = (
-                0,
-                0,
-                0,
-                0,
-            )
-            try:
-                while 1:
-                    f = fqueue.get()
-                    if f is None:
-                        break
-                    (t, o, f, v) = main(src_base, out_base, [f], [], outfile)
-                    tot_files += t
-                    okay_files += o
-                    failed_files += f
-                    verify_failed_files += v
-            except (Empty, KeyboardInterrupt):
-                pass
-            rqueue.put((tot_files, okay_files, failed_files, verify_failed_files))
-            rqueue.close()
+        from multiprocessing import Array, Pool
+
+        # total, okay, failed, and verify-failed file counts, updated
+        # by the workers in shared memory.
+        counts = Array("q", 4)
+
+        # Hand each worker a batch of files per call to main(), to cut
+        # down on per-task pickling and per-call setup, while still
+        # leaving enough batches to balance out files that take much
+        # longer than the rest.
+        if out_base is None and outfile is None:
+            # Without an output path, main() prints only the first file
+            # of each call to stdout, so go one file at a time.
+            batch_size = 1
+        else:
+            batch_size = max(1, min(32, len(pyc_paths) // (numproc * 4)))
+        batches = (
+            pyc_paths[i : i + batch_size]
+            for i in range(0, len(pyc_paths), batch_size)
+        )
 
+        # Don't let forked workers inherit, and later repeat, anything
+        # still sitting in our stdout buffer.
+        sys.stdout.flush()
         try:
-            procs = [Process(target=process_func) for i in range(numproc)]
-            for p in procs:
-                p.start()
-            for p in procs:
-                p.join()
-            try:
-                (tot_files, okay_files, failed_files, verify_failed_files) = (
-                    0,
-                    0,
-                    0,
-                    0,
-                )
-                while True:
-                    (t, o, f, v) = rqueue.get(False)
-                    tot_files += t
-                    okay_files += o
-                    failed_files += f
-                    verify_failed_files += v
-            except Empty:
-                pass
-            print(
-                "# decompiled %i files: %i okay, %i failed, %i verify failed"
-                % (tot_files, okay_files, failed_files, verify_failed_files)
-            )
-        except (KeyboardInterrupt, OSError):
+            with Pool(
+                numproc,
+                initializer=_init_worker,
+                initargs=(src_base, out_base, outfile, options, counts),
+            ) as pool:
+                for _ in pool.imap_unordered(_decompile_batch, batches):
+                    pass
+        except ImportError as e:
+            print(str(e))
+            sys.exit(2)
+        except KeyboardInterrupt:
             pass
+        else:
+            tot_files, okay_files, failed_files, verify_failed_files = counts[:]
+            sys.stdout.write(
+                f"# decompiled {tot_files} files: {okay_files} okay, "
+                f"{failed_files} failed, {verify_failed_files} verify failed\n"
+            )
 
     if timestamp:
         print(time.strftime(timestampfmt))
@@ -44,12 +44,12 @@ def _get_outstream(outfile: str) -> Any:
     """
     dir_name = osp.dirname(outfile)
     failed_file = outfile + "_failed"
-    if osp.exists(failed_file):
-        os.remove(failed_file)
     try:
-        os.makedirs(dir_name)
-    except OSError:
+        os.remove(failed_file)
+    except FileNotFoundError:
         pass
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
     return open(outfile, mode="w", encoding="utf-8")
 
 